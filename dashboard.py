@@ -5,24 +5,276 @@ Bachata King Festival - Analytics Dashboard
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import datetime, timedelta
 import numpy as np
 import os
-import subprocess
-import shutil
+import re
+import threading
+import time
 from typing import Optional, Dict, List, Tuple
-from dotenv import load_dotenv
+
+# plotly.express, subprocess, shutil and dotenv are imported where they are used,
+# so the login page doesn't pay for them
+
+
+# Low-cardinality text columns that are stored as categoricals
+CATEGORY_COLS = {'status', 'role', 'country', 'service'}
+
+# Amount in payment strings such as "€120.00 Completed Local"
+_PRICE_RE = re.compile(r'(\d+\.?\d*)')
+
+# Version of the derived columns built by _load_and_process. Bump it whenever the
+# processing changes, so Parquet copies written by older code are rebuilt from the CSV.
+_PROCESSING_VERSION = '5'
+
+# Day number that missing dates (NaT) map to in the *_day columns
+_NAT_DAY = np.iinfo(np.int64).min
+
+# All known possible statuses from booking systems
+_KNOWN_STATUSES = frozenset({
+    'Approved', 'Pending', 'Cancelled', 'Rejected', 'Done',
+    'Confirmed', 'No-show', 'Rescheduled', 'Completed',
+    'In Progress', 'Waiting', 'Draft', 'Expired'
+})
+
+# Colors that make sense for dance roles
+_ROLE_COLORS = ('#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4')
+
+
+@st.cache_data(show_spinner=False)
+def _read_credentials() -> Tuple[Optional[str], Optional[str]]:
+    """Read dashboard credentials from Streamlit secrets, .env file, or system env vars."""
+    # Priority 1: Try Streamlit secrets (for Streamlit Cloud)
+    try:
+        username = st.secrets["DASHBOARD_USERNAME"]
+        password = st.secrets["DASHBOARD_PASSWORD"]
+        if username and password:
+            return username, password
+    except (KeyError, FileNotFoundError):
+        # Streamlit secrets not available, continue to environment variables
+        pass
+    
+    # Priority 2: Load environment variables from .env file if it exists (for local development)
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    # Get credentials from environment variables
+    return os.getenv('DASHBOARD_USERNAME'), os.getenv('DASHBOARD_PASSWORD')
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_and_process(path: str, mtime: float) -> pd.DataFrame:
+    """Load the appointments data and clean/process the raw CSV.
+    
+    ``mtime`` is only used as part of the cache key, so a rewritten file
+    (e.g. by the scraper) is read again instead of served from the cache.
+    Only the current CSV and Parquet versions are kept, not every past one.
+    """
+    if path.endswith('.parquet'):
+        # Written by save_parquet from an already processed frame, dtypes included
+        return pd.read_parquet(path, engine='pyarrow')
+    
+    # Every exported column is kept, since the data table and CSV download show them all;
+    # the charts and aggregations only ever pass the columns they need to their helpers
+    header = pd.read_csv(path, nrows=0).columns
+    date_columns = [col for col in header if 'date' in col.lower() or 'created' in col.lower()]
+    category_columns = {
+        col: 'category' for col in header
+        if col not in date_columns and 'duration' not in col.lower()
+        and any(pattern in col.lower() for pattern in CATEGORY_COLS)
+    }
+    
+    # The default C parser, since pandas' pyarrow engine cannot read the multi-line
+    # quoted values that appear in the Notes column
+    df = pd.read_csv(path, dtype=category_columns, parse_dates=date_columns)
+    
+    # Coerce date columns the parser could not convert as a whole
+    for col in date_columns:
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        # Days since the epoch, for cheap integer filtering and grouping
+        df[f'{col}_day'] = df[col].values.astype('datetime64[D]').view('int64')
+    
+    # Process payment columns
+    payment_columns = [col for col in header if col not in date_columns
+                       and ('payment' in col.lower() or 'price' in col.lower())]
+    for col in payment_columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            # Already numeric in the export, so the charts and filters can use it as is
+            df[f'{col}_numeric'] = df[col].astype('float64')
+        else:
+            # Extract numeric values from payment strings
+            extracted = df[col].str.extract(_PRICE_RE, expand=False)
+            # Kept as float64: float32 sums of money amounts are off by cents
+            df[f'{col}_numeric'] = pd.to_numeric(extracted, errors='coerce').astype('float64')
+    
+    # Process duration columns
+    duration_columns = [col for col in df.columns if 'duration' in col.lower()]
+    for col in duration_columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[f'{col}_hours'] = df[col].astype('float32') / 60.0  # Convert minutes to hours
+    
+    # Store any other repetitive text columns as categoricals too
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col].dtype):
+            if df[col].nunique() < 0.05 * len(df):
+                df[col] = df[col].astype('category')
+    
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def _parquet_is_current(path: str, mtime: float) -> bool:
+    """Check that a Parquet copy was written by the current processing code."""
+    import pyarrow.parquet as pq
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except Exception:
+        return False
+    return metadata.get(b'processing_version') == _PROCESSING_VERSION.encode()
+
+
+@st.cache_resource
+def _loaded_frames() -> Dict[str, Tuple[float, pd.DataFrame]]:
+    """Last loaded (mtime, frame) per data file, shared by all sessions.
+    
+    The frames are never modified after loading, so sharing them is safe.
+    """
+    return {}
+
+
+@st.cache_data(show_spinner=False)
+def _load_filter_options(path: str, mtime: float) -> Dict[str, List[str]]:
+    """Get the sorted values of each categorical column for the sidebar filters."""
+    df = _load_and_process(path, mtime)
+    return {
+        col: sorted(df[col].dropna().unique())
+        for col in df.select_dtypes('category').columns
+    }
+
+
+def _collect_lines(stream, lines: List[str]):
+    """Append lines from a subprocess pipe to a list until the pipe closes."""
+    for line in stream:
+        lines.append(line)
+    stream.close()
+
+
+# The aggregation helpers below also take the data file's mtime. Streamlit hashes only a
+# sample of rows for large frames, so the mtime makes a new data version always miss.
+
+@st.cache_data(show_spinner=False)
+def _count_values(values: pd.Series, mtime: float, dropna: bool = True) -> pd.Series:
+    """Count values in a column, leaving out categories absent from the data."""
+    counts = values.value_counts(dropna=dropna)
+    return counts[counts > 0]
+
+
+@st.cache_data(show_spinner=False)
+def _revenue_by_country(countries: pd.Series, revenue: pd.Series, mtime: float) -> pd.Series:
+    """Total revenue for the ten highest-earning countries."""
+    # Only paying rows can contribute, so drop the rest before grouping
+    paid = revenue.gt(0).to_numpy()
+    # Money is always summed in float64 (a no-op for the float64 *_numeric columns)
+    amounts = revenue[paid].astype('float64', copy=False)
+    return amounts.groupby(countries[paid], observed=True, sort=False).sum().nlargest(10)
+
+
+@st.cache_data(show_spinner=False)
+def _daily_revenue(days: pd.Series, revenue: pd.Series, mtime: float) -> pd.Series:
+    """Total revenue per calendar day, from a column of day numbers."""
+    days = days.to_numpy()
+    has_day = days != _NAT_DAY
+    days = days[has_day]
+    if len(days) == 0:
+        return pd.Series(dtype='float64')
+    
+    # Sum per day number; days without any appointments are left out as before
+    first_day = days.min()
+    amounts = np.nan_to_num(revenue.to_numpy(dtype='float64')[has_day])
+    totals = np.bincount(days - first_day, weights=amounts)
+    offsets = np.bincount(days - first_day).nonzero()[0]
+    return pd.Series(totals[offsets], index=(offsets + first_day).astype('datetime64[D]'))
+
+
+# A full CSV string per filter state adds up, so only keep the most recent few
+@st.cache_data(show_spinner=False, max_entries=4)
+def _to_csv(df: pd.DataFrame, columns: Tuple[str, ...], mtime: float) -> str:
+    """CSV export of the given columns, reused until the data or filters change."""
+    return df.to_csv(index=False, columns=list(columns))
+
+
+@st.cache_resource
+def _chart_template() -> go.layout.Template:
+    """Shared layout for all dashboard charts."""
+    return go.layout.Template(layout=dict(height=400))
+
+
+@st.cache_data(show_spinner=False)
+def _build_bar(x: tuple, y: tuple, title: str, orientation: str = 'v',
+               hover_names: Optional[tuple] = None, tickangle: Optional[int] = None) -> dict:
+    """Build a bar chart figure, cached on the plotted values."""
+    import plotly.express as px
+    
+    fig = px.bar(x=x, y=y, orientation=orientation, title=title)
+    
+    if hover_names is not None:
+        # Show the full name on hover when the axis labels are truncated
+        fig.update_traces(
+            hovertemplate='<b>%{customdata}</b><br>Count: %{y}<extra></extra>',
+            customdata=hover_names
+        )
+    
+    if tickangle is not None:
+        fig.update_layout(xaxis_tickangle=tickangle)
+    return fig.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def _build_pie(values: tuple, names: tuple, title: str, colors: Optional[tuple] = None) -> dict:
+    """Build a pie chart figure, cached on the plotted values."""
+    import plotly.express as px
+    
+    fig = px.pie(values=values, names=names, title=title, color_discrete_sequence=colors)
+    return fig.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def _build_line(x: tuple, y: tuple, title: str, x_label: str, y_label: str) -> dict:
+    """Build a line chart figure with markers, cached on the plotted values."""
+    import plotly.express as px
+    
+    fig = px.line(x=x, y=y, title=title, labels={'x': x_label, 'y': y_label}, markers=True)
+    return fig.to_dict()
 
 
 class AppointmentsDashboard:
     """Main dashboard class for festival analytics."""
     
+    # Column patterns for each dashboard role, in order of preference
+    COLUMN_PATTERNS = {
+        'filter_date': ['appointment date', 'date', 'start'],
+        'timeline_date': ['appointment date', 'date', 'created'],
+        'revenue_date': ['created', 'date'],
+        'status': ['status'],
+        'service': ['service'],
+        'role': ['role'],
+        'country': ['country'],
+        'price': ['price'],
+        'revenue': ['payment', 'price'],
+        'email': ['email'],
+    }
+    
     def __init__(self):
         """Initialize the dashboard."""
         self.df: Optional[pd.DataFrame] = None
         self.original_df: Optional[pd.DataFrame] = None
+        self._lower_cols: Dict[str, str] = {}
+        self._filter_options: Dict[str, List[str]] = {}
+        self._data_mtime: Optional[float] = None
+        self.cols: Dict[str, Optional[str]] = dict.fromkeys(self.COLUMN_PATTERNS)
         self.setup_page()
     
     def setup_page(self):
@@ -34,6 +286,11 @@ class AppointmentsDashboard:
             initial_sidebar_state="expanded"
         )
         
+        # Shared chart layout, layered on top of Streamlit's default chart theme
+        pio.templates['bachata_king'] = _chart_template()
+        if not pio.templates.default.endswith('+bachata_king'):
+            pio.templates.default += '+bachata_king'
+        
         # Custom CSS
         st.markdown("""
         <style>
@@ -68,28 +325,15 @@ class AppointmentsDashboard:
         """Load users from Streamlit secrets, .env file, or system env vars."""
         users = {}
         try:
-            # Priority 1: Try Streamlit secrets (for Streamlit Cloud)
-            try:
-                username = st.secrets["DASHBOARD_USERNAME"]
-                password = st.secrets["DASHBOARD_PASSWORD"]
-                if username and password:
-                    users[username] = password
-                    return users
-            except (KeyError, FileNotFoundError):
-                # Streamlit secrets not available, continue to environment variables
-                pass
-            
-            # Priority 2: Load environment variables from .env file if it exists (for local development)
-            load_dotenv()
-            
-            # Get credentials from environment variables
-            username = os.getenv('DASHBOARD_USERNAME')
-            password = os.getenv('DASHBOARD_PASSWORD')
+            username, password = _read_credentials()
             
             if username and password:
                 users[username] = password
                 return users
             else:
+                # Don't keep a failed lookup cached, so fixing the .env takes effect on the next run
+                _read_credentials.clear()
+                
                 # Show detailed error message about missing configuration
                 missing_vars = []
                 if not username:
@@ -213,8 +457,18 @@ class AppointmentsDashboard:
     def load_data(self) -> bool:
         """Load and process the appointments data."""
         try:
-            file_path = 'Appointments.csv'
-            if not os.path.exists(file_path):
+            csv_file = 'Appointments.csv'
+            parquet_file = 'Appointments.parquet'
+            
+            # Prefer the processed Parquet copy unless the CSV is newer (e.g. freshly uploaded)
+            # or the copy was written by an older version of the processing
+            if os.path.exists(parquet_file) and (
+                not os.path.exists(csv_file) or os.path.getmtime(parquet_file) >= os.path.getmtime(csv_file)
+            ) and _parquet_is_current(parquet_file, os.path.getmtime(parquet_file)):
+                file_path = parquet_file
+            elif os.path.exists(csv_file):
+                file_path = csv_file
+            else:
                 st.error("❌ Appointments.csv not found! Please run the scraper first.")
                 return False
             
@@ -223,12 +477,21 @@ class AppointmentsDashboard:
             file_size = os.path.getsize(file_path)
             st.info(f"📁 Data updated: {datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')} | Size: {file_size:,} bytes")
             
-            # Load data
-            self.original_df = pd.read_csv(file_path)
-            self.df = self.original_df.copy()
-            
-            # Clean and process data
-            self.process_data()
+            # Load data (cached until the file is rewritten). The last loaded frame is kept
+            # process-wide, so unchanged files skip even the cache's copy of the frame.
+            loaded_frames = _loaded_frames()
+            last_mtime, last_df = loaded_frames.get(file_path, (None, None))
+            if last_df is not None and last_mtime == mod_time:
+                self.original_df = last_df
+            else:
+                self.original_df = _load_and_process(file_path, mod_time)
+                loaded_frames[file_path] = (mod_time, self.original_df)
+            # Filters slice original_df with a mask and never modify it, so no copy is needed
+            self.df = self.original_df
+            self._lower_cols = {col.lower(): col for col in self.df.columns}
+            self._resolve_columns()
+            self._filter_options = _load_filter_options(file_path, mod_time)
+            self._data_mtime = mod_time
             
             st.success(f"✅ Loaded {len(self.df)} appointments with {len(self.df.columns)} columns")
             return True
@@ -237,34 +500,12 @@ class AppointmentsDashboard:
             st.error(f"❌ Error loading data: {str(e)}")
             return False
     
-    def process_data(self):
-        """Clean and process the raw data."""
-        if self.df is None:
-            return
-        
-        # Process date columns
-        date_columns = [col for col in self.df.columns if 'date' in col.lower() or 'created' in col.lower()]
-        for col in date_columns:
-            self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
-        
-        # Process payment columns
-        payment_columns = [col for col in self.df.columns if 'payment' in col.lower() or 'price' in col.lower()]
-        for col in payment_columns:
-            if self.df[col].dtype == 'object':
-                # Extract numeric values from payment strings
-                self.df[f'{col}_numeric'] = self.df[col].str.extract(r'€?(\d+\.?\d*)', expand=False).astype(float)
-        
-        # Process duration columns
-        duration_columns = [col for col in self.df.columns if 'duration' in col.lower()]
-        for col in duration_columns:
-            if self.df[col].dtype in ['int64', 'float64']:
-                self.df[f'{col}_hours'] = self.df[col] / 60  # Convert minutes to hours
-    
     def get_column_options(self, pattern: str) -> List[str]:
         """Get available columns matching a pattern."""
         if self.df is None:
             return []
-        return [col for col in self.df.columns if pattern.lower() in col.lower()]
+        pattern = pattern.lower()
+        return [col for lower_col, col in self._lower_cols.items() if pattern in lower_col]
     
     def get_best_column(self, patterns: List[str]) -> Optional[str]:
         """Get the best available column from a list of patterns."""
@@ -277,6 +518,23 @@ class AppointmentsDashboard:
                 return matches[0]
         return None
     
+    def _resolve_columns(self):
+        """Pick the column used for each dashboard role."""
+        # Filtering keeps the columns, so this only needs to run once per load_data
+        self.cols = {role: self.get_best_column(patterns) for role, patterns in self.COLUMN_PATTERNS.items()}
+    
+    def get_filter_options(self, column: str) -> List[str]:
+        """Get the sorted non-null values of a column for a filter."""
+        if column not in self._filter_options:
+            self._filter_options[column] = sorted(self.original_df[column].dropna().unique())
+        return self._filter_options[column]
+    
+    def count_values(self, column: str, dropna: bool = True) -> pd.Series:
+        """Count values in a column, leaving out categories absent from the current data."""
+        # Cached on the column's contents, so charts sharing a column and unchanged
+        # filter states reuse the same counts
+        return _count_values(self.df[column], self._data_mtime, dropna)
+    
     def create_sidebar_filters(self):
         """Create sidebar filters for data filtering."""
         if self.df is None:
@@ -286,46 +544,57 @@ class AppointmentsDashboard:
         self.show_filter_summary()
         st.sidebar.markdown("---")
         
+        # Each filter returns a boolean mask over original_df (or None when inactive)
+        masks = []
+        
         # Date filter
-        date_col = self.get_best_column(['appointment date', 'date', 'start'])
+        date_col = self.cols['filter_date']
         if date_col:
-            self.create_date_filter(date_col)
+            masks.append(self.create_date_filter(date_col))
         
         # Status filter
-        status_col = self.get_best_column(['status'])
+        status_col = self.cols['status']
         if status_col:
-            self.create_status_filter(status_col)
+            masks.append(self.create_status_filter(status_col))
         
         # Service filter
-        service_col = self.get_best_column(['service'])
+        service_col = self.cols['service']
         if service_col:
-            self.create_service_filter(service_col)
+            masks.append(self.create_service_filter(service_col))
         
         # Role filter
-        role_col = self.get_best_column(['role'])
+        role_col = self.cols['role']
         if role_col:
-            self.create_role_filter(role_col)
+            masks.append(self.create_role_filter(role_col))
         
         # Country filter
-        country_col = self.get_best_column(['country'])
+        country_col = self.cols['country']
         if country_col:
-            self.create_multiselect_filter("🌍 Country", country_col)
+            masks.append(self.create_multiselect_filter("🌍 Country", country_col))
         
         # Price filter
-        price_col = self.get_best_column(['price'])
+        price_col = self.cols['price']
         if price_col:
-            self.create_price_filter(price_col)
+            masks.append(self.create_price_filter(price_col))
+        
+        # Apply all active filters in one pass
+        mask = np.ones(len(self.original_df), dtype=bool)
+        for filter_mask in masks:
+            if filter_mask is not None:
+                mask &= filter_mask
+        if not mask.all():
+            self.df = self.original_df.loc[mask]
         
         # Clear filters button
         st.sidebar.markdown("---")
         if st.sidebar.button("🗑️ Clear All Filters", type="primary"):
             st.rerun()
     
-    def create_date_filter(self, date_col: str):
+    def create_date_filter(self, date_col: str) -> Optional[np.ndarray]:
         """Create date range filter with no default filtering."""
-        date_data = self.df[date_col].dropna()
+        date_data = self.original_df[date_col].dropna()
         if len(date_data) == 0:
-            return
+            return None
         
         min_date = date_data.min().date()
         max_date = date_data.max().date()
@@ -341,32 +610,27 @@ class AppointmentsDashboard:
         
         # Only apply filter if user has changed from the full range
         if len(date_range) == 2 and (date_range[0] != min_date or date_range[1] != max_date):
-            self.df = self.df[
-                (self.df[date_col].dt.date >= date_range[0]) & 
-                (self.df[date_col].dt.date <= date_range[1])
-            ]
+            days = self.original_df[f"{date_col}_day"].values
+            start = np.datetime64(date_range[0], 'D').astype('int64')
+            end = np.datetime64(date_range[1], 'D').astype('int64')
+            return (days >= start) & (days <= end)
+        return None
     
-    def create_status_filter(self, status_col: str):
+    def create_status_filter(self, status_col: str) -> Optional[np.ndarray]:
         """Create status multiselect filter with all possible booking statuses."""
         # Get actual statuses from current data
-        actual_statuses = set(self.df[status_col].dropna().unique())
+        sorted_statuses = self.get_filter_options(status_col)
+        actual_statuses = set(sorted_statuses)
         
-        # Define all known possible statuses from booking systems
-        all_known_statuses = {
-            'Approved', 'Pending', 'Cancelled', 'Rejected', 'Done', 
-            'Confirmed', 'No-show', 'Rescheduled', 'Completed', 
-            'In Progress', 'Waiting', 'Draft', 'Expired'
-        }
+        if len(actual_statuses) == 0:
+            return None
         
         # Combine actual statuses with known statuses
-        all_statuses = sorted(list(actual_statuses.union(all_known_statuses)))
-        
-        if len(actual_statuses) == 0:
-            return
+        all_statuses = sorted(actual_statuses | _KNOWN_STATUSES)
         
         # Show info about current data vs all options
         if len(actual_statuses) < len(all_statuses):
-            st.sidebar.info(f"📊 Current data has: {', '.join(sorted(actual_statuses))}")
+            st.sidebar.info(f"📊 Current data has: {', '.join(sorted_statuses)}")
         
         selected_statuses = st.sidebar.multiselect(
             f"📊 {status_col.title()} (Optional)",
@@ -378,23 +642,18 @@ class AppointmentsDashboard:
         
         if selected_statuses:
             # Only apply filter for statuses that actually exist in the data
+            # (if none of them do, this shows an empty result)
             valid_selected = [s for s in selected_statuses if s in actual_statuses]
-            if valid_selected:
-                self.df = self.df[self.df[status_col].isin(valid_selected)]
-            else:
-                # If no valid statuses selected, show empty result
-                self.df = self.df[self.df[status_col].isin([])]
+            return self.original_df[status_col].isin(valid_selected).to_numpy()
+        return None
     
-    def create_service_filter(self, service_col: str):
+    def create_service_filter(self, service_col: str) -> Optional[np.ndarray]:
         """Create service multiselect filter with only services that exist in the data."""
-        # Get actual services from current data
-        actual_services = self.df[service_col].dropna().unique()
-        
-        if len(actual_services) == 0:
-            return
+        # Get actual services from current data, sorted alphabetically for better UX
+        sorted_services = self.get_filter_options(service_col)
         
-        # Sort services alphabetically for better UX
-        sorted_services = sorted(actual_services)
+        if len(sorted_services) == 0:
+            return None
         
         selected_services = st.sidebar.multiselect(
             f"🎯 {service_col.title()} (Optional)",
@@ -405,22 +664,23 @@ class AppointmentsDashboard:
         )
         
         if selected_services:
-            self.df = self.df[self.df[service_col].isin(selected_services)]
+            return self.original_df[service_col].isin(selected_services).to_numpy()
+        return None
     
-    def create_role_filter(self, role_col: str):
+    def create_role_filter(self, role_col: str) -> Optional[np.ndarray]:
         """Create role multiselect filter for dance roles."""
         # Get actual roles from current data (excluding nulls for the filter options)
-        actual_roles = self.df[role_col].dropna().unique()
+        actual_roles = self.get_filter_options(role_col)
         
         if len(actual_roles) == 0:
-            return
+            return None
         
         # Sort roles in a logical order for dance context
         role_order = ['Leader', 'Follower', 'Both']
         sorted_roles = [role for role in role_order if role in actual_roles]
-        # Add any other roles not in the predefined order
+        # Add any other roles not in the predefined order (options are already sorted)
         other_roles = [role for role in actual_roles if role not in role_order]
-        sorted_roles.extend(sorted(other_roles))
+        sorted_roles.extend(other_roles)
         
         selected_roles = st.sidebar.multiselect(
             f"💃 {role_col.title()} (Optional)",
@@ -431,34 +691,36 @@ class AppointmentsDashboard:
         )
         
         if selected_roles:
-            self.df = self.df[self.df[role_col].isin(selected_roles)]
+            return self.original_df[role_col].isin(selected_roles).to_numpy()
+        return None
     
-    def create_multiselect_filter(self, label: str, column: str):
+    def create_multiselect_filter(self, label: str, column: str) -> Optional[np.ndarray]:
         """Create a generic multiselect filter."""
-        values = self.df[column].dropna().unique()
+        values = self.get_filter_options(column)
         if len(values) == 0:
-            return
+            return None
         
         selected_values = st.sidebar.multiselect(
             f"{label} (Optional)",
-            options=sorted(values),
+            options=values,
             default=[],  # No default selection - show all data
             key=f"filter_{column}",
             help="Select specific values to filter, or leave empty to show all appointments."
         )
         
         if selected_values:
-            self.df = self.df[self.df[column].isin(selected_values)]
+            return self.original_df[column].isin(selected_values).to_numpy()
+        return None
     
-    def create_price_filter(self, price_col: str):
+    def create_price_filter(self, price_col: str) -> Optional[np.ndarray]:
         """Create price range filter."""
         numeric_col = f"{price_col}_numeric"
-        if numeric_col not in self.df.columns:
-            return
+        if numeric_col not in self.original_df.columns:
+            return None
         
-        price_data = self.df[numeric_col].dropna()
+        price_data = self.original_df[numeric_col].dropna()
         if len(price_data) == 0:
-            return
+            return None
         
         min_price = float(price_data.min())
         max_price = float(price_data.max())
@@ -474,10 +736,9 @@ class AppointmentsDashboard:
         )
         
         if price_range[0] != min_price or price_range[1] != max_price:
-            self.df = self.df[
-                (self.df[numeric_col] >= price_range[0]) & 
-                (self.df[numeric_col] <= price_range[1])
-            ]
+            prices = self.original_df[numeric_col].values
+            return (prices >= price_range[0]) & (prices <= price_range[1])
+        return None
     
     def show_filter_summary(self):
         """Show filter summary in sidebar."""
@@ -499,6 +760,9 @@ class AppointmentsDashboard:
     
     def refresh_data(self):
         """Safely refresh data by running the scraper."""
+        import subprocess
+        import shutil
+        
         # Prevent scraper execution on Streamlit Cloud
         if not self.is_local_environment():
             st.error("❌ Scraper cannot run on Streamlit Cloud")
@@ -511,34 +775,46 @@ class AppointmentsDashboard:
             backup_file = 'Appointments_backup.csv'
             
             # Show progress
-            with st.spinner("🔄 Running scraper to fetch latest data..."):
+            with st.status("🔄 Running scraper to fetch latest data...") as status:
                 # Backup existing file if it exists
                 if os.path.exists(csv_file):
-                    shutil.copy2(csv_file, backup_file)
+                    # A hard link is enough since the scraper replaces the file instead of
+                    # writing into it; copy where links aren't supported
+                    if os.path.exists(backup_file):
+                        os.remove(backup_file)
+                    try:
+                        os.link(csv_file, backup_file)
+                    except (OSError, AttributeError):
+                        shutil.copy2(csv_file, backup_file)
                     st.info("📁 Backed up existing data")
                 
                 # Run the scraper
-                result = subprocess.run(
-                    ['python', 'scraper.py'], 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=300  # 5 minute timeout
-                )
+                try:
+                    returncode, stdout, stderr = self.run_scraper(status, timeout=300)  # 5 minute timeout
+                except BaseException as e:
+                    if not isinstance(e, Exception):
+                        # Interrupted by a Streamlit rerun/stop; the scraper has been stopped,
+                        # so put the previous data back before the script moves on
+                        self.restore_backup(csv_file, backup_file)
+                    raise
                 
                 # Check if scraper succeeded
-                if result.returncode == 0:
+                if returncode == 0:
                     # Verify the new CSV file exists and is valid
                     if os.path.exists(csv_file):
                         try:
-                            # Test if the new CSV is readable
-                            test_df = pd.read_csv(csv_file)
-                            if len(test_df) > 0:
+                            # Test if the new CSV is readable (the first chunk is enough)
+                            with pd.read_csv(csv_file, chunksize=1024) as reader:
+                                first_chunk = next(reader, None)
+                            if first_chunk is not None and len(first_chunk) > 0:
                                 # Success! Remove backup and reload data
                                 if os.path.exists(backup_file):
                                     os.remove(backup_file)
                                 
+                                # Store a processed Parquet copy for faster loading
+                                self.save_parquet(csv_file)
+                                
                                 st.success("✅ Data refreshed successfully!")
-                                st.info(f"📊 New data contains {len(test_df)} appointments")
                                 
                                 # Reload the data in the dashboard
                                 self.load_data()
@@ -550,7 +826,7 @@ class AppointmentsDashboard:
                     else:
                         raise FileNotFoundError("Scraper did not create CSV file")
                 else:
-                    raise subprocess.CalledProcessError(result.returncode, "scraper.py", result.stderr)
+                    raise subprocess.CalledProcessError(returncode, "scraper.py", stdout, stderr)
                     
         except subprocess.TimeoutExpired as e:
             st.error("⏰ Scraper timed out after 5 minutes")
@@ -605,12 +881,74 @@ Full Traceback:
                 """)
             self.restore_backup(csv_file, backup_file)
     
+    def run_scraper(self, status, timeout: int) -> Tuple[int, str, str]:
+        """Run the scraper in a subprocess, showing its latest output line in the status box."""
+        import subprocess
+        
+        cmd = ['python', '-u', 'scraper.py']  # Unbuffered, so progress lines arrive as printed
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        
+        # Drain both pipes in the background so neither can fill up and block the scraper
+        stdout_lines: List[str] = []
+        stderr_lines: List[str] = []
+        readers = [
+            threading.Thread(target=_collect_lines, args=(proc.stdout, stdout_lines), daemon=True),
+            threading.Thread(target=_collect_lines, args=(proc.stderr, stderr_lines), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        
+        deadline = time.monotonic() + timeout
+        shown = 0
+        try:
+            while proc.poll() is None:
+                if time.monotonic() > deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout, ''.join(stdout_lines), ''.join(stderr_lines))
+                
+                # Streamlit raises its rerun/stop exceptions here when the user interacts meanwhile
+                if len(stdout_lines) > shown:
+                    shown = len(stdout_lines)
+                    status.update(label=stdout_lines[-1].strip())
+                time.sleep(0.1)
+        finally:
+            # Never leave the scraper running on its own, whatever interrupted the wait
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        
+        for reader in readers:
+            reader.join()
+        return proc.returncode, ''.join(stdout_lines), ''.join(stderr_lines)
+    
+    def save_parquet(self, csv_file: str, parquet_file: str = 'Appointments.parquet'):
+        """Save the processed CSV data as Parquet, keeping parsed dates and numeric columns."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            df = _load_and_process(csv_file, os.path.getmtime(csv_file))
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Tag the copy so load_data can tell whether it matches the current processing
+            metadata = {**(table.schema.metadata or {}), b'processing_version': _PROCESSING_VERSION.encode()}
+            pq.write_table(table.replace_schema_metadata(metadata), parquet_file, compression='snappy')
+        except Exception as e:
+            # The CSV stays the source of truth, so loading just falls back to it
+            st.warning(f"⚠️ Could not save Parquet copy: {e}")
+    
     def restore_backup(self, csv_file: str, backup_file: str):
         """Restore backup file if something went wrong."""
         try:
             if os.path.exists(backup_file):
-                shutil.copy2(backup_file, csv_file)
-                os.remove(backup_file)
+                if os.path.exists(csv_file) and os.path.samefile(backup_file, csv_file):
+                    # CSV was never replaced, so it still is the backup
+                    os.remove(backup_file)
+                else:
+                    os.replace(backup_file, csv_file)
                 st.warning("⚠️ Restored previous data due to error")
             else:
                 st.warning("⚠️ No backup available to restore")
@@ -624,6 +962,14 @@ Full Traceback:
         
         st.subheader("📊 Key Metrics")
         
+        # Revenue totals, aggregated once for both revenue cards
+        revenue_stats = None
+        revenue_col = self.cols['revenue']
+        if revenue_col:
+            numeric_col = f"{revenue_col}_numeric"
+            if numeric_col in self.df.columns:
+                revenue_stats = self.df[numeric_col].astype('float64', copy=False).agg(['sum', 'mean'])
+        
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
@@ -631,33 +977,21 @@ Full Traceback:
         
         with col2:
             # Calculate revenue
-            revenue_col = self.get_best_column(['payment', 'price'])
-            if revenue_col:
-                numeric_col = f"{revenue_col}_numeric"
-                if numeric_col in self.df.columns:
-                    total_revenue = self.df[numeric_col].sum()
-                    st.metric("💰 Total Revenue", f"€{total_revenue:,.2f}")
-                else:
-                    st.metric("💰 Total Revenue", "N/A")
+            if revenue_stats is not None:
+                st.metric("💰 Total Revenue", f"€{revenue_stats['sum']:,.2f}")
             else:
                 st.metric("💰 Total Revenue", "N/A")
         
         with col3:
             # Average payment
-            revenue_col = self.get_best_column(['payment', 'price'])
-            if revenue_col:
-                numeric_col = f"{revenue_col}_numeric"
-                if numeric_col in self.df.columns:
-                    avg_payment = self.df[numeric_col].mean()
-                    st.metric("📈 Average Payment", f"€{avg_payment:.2f}")
-                else:
-                    st.metric("📈 Average Payment", "N/A")
+            if revenue_stats is not None:
+                st.metric("📈 Average Payment", f"€{revenue_stats['mean']:.2f}")
             else:
                 st.metric("📈 Average Payment", "N/A")
         
         with col4:
             # Unique customers
-            email_col = self.get_best_column(['email'])
+            email_col = self.cols['email']
             if email_col:
                 unique_customers = self.df[email_col].nunique()
                 st.metric("👥 Unique Customers", unique_customers)
@@ -681,7 +1015,10 @@ Full Traceback:
             else:
                 st.info("💡 Running on Streamlit Cloud\nUse file upload to add data")
         
-
+        self.show_chart_grid()
+    
+    def show_chart_grid(self):
+        """Display the analytics chart rows."""
         # Row 1: Geographic and Service analysis
         col1, col2 = st.columns(2)
         
@@ -716,95 +1053,94 @@ Full Traceback:
     
     def create_timeline_chart(self):
         """Create appointments timeline chart."""
-        date_col = self.get_best_column(['appointment date', 'date', 'created'])
+        date_col = self.cols['timeline_date']
         if not date_col:
             st.info("No date information available")
             return
         
         st.markdown("**📅 Appointments Over Time**")
         
-        # Group by date
-        daily_counts = self.df.groupby(self.df[date_col].dt.date).size().reset_index()
-        daily_counts.columns = ['Date', 'Count']
+        # Count per day number, then turn the days back into dates for the labels
+        days = self.df[f"{date_col}_day"].values
+        days = days[days != _NAT_DAY]
+        if len(days) > 0:
+            first_day = days.min()
+            counts = np.bincount(days - first_day)
+            offsets = counts.nonzero()[0]
+            daily_counts = pd.DataFrame({
+                'Date': (offsets + first_day).astype('datetime64[D]'),
+                'Count': counts[offsets]
+            })
+        else:
+            daily_counts = pd.DataFrame(columns=['Date', 'Count'])
         
         if len(daily_counts) > 0:
-            fig = px.line(daily_counts, x='Date', y='Count', 
-                         title="Daily Appointments", markers=True)
-            fig.update_layout(height=400)
+            fig = _build_line(tuple(daily_counts['Date']), tuple(daily_counts['Count']),
+                              "Daily Appointments", 'Date', 'Count')
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No timeline data available")
     
     def create_status_chart(self):
         """Create status distribution chart."""
-        status_col = self.get_best_column(['status'])
+        status_col = self.cols['status']
         if not status_col:
             st.info("No status information available")
             return
         
         st.markdown("**📊 Status Distribution**")
         
-        status_counts = self.df[status_col].value_counts()
+        status_counts = self.count_values(status_col)
         if len(status_counts) > 0:
-            fig = px.pie(values=status_counts.values, names=status_counts.index,
-                        title="Status Distribution")
-            fig.update_layout(height=400)
+            fig = _build_pie(tuple(status_counts.values), tuple(status_counts.index),
+                             "Status Distribution")
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No status data available")
     
     def create_country_chart(self):
         """Create country distribution chart."""
-        country_col = self.get_best_column(['country'])
+        country_col = self.cols['country']
         if not country_col:
             st.info("No country information available")
             return
         
-        country_counts = self.df[country_col].value_counts()
+        country_counts = self.count_values(country_col)
         num_countries = len(country_counts)
         
         st.markdown(f"**🌍 All Countries ({num_countries} countries)**")
         
         if len(country_counts) > 0:
-            fig = px.bar(x=country_counts.values, y=country_counts.index,
-                        orientation='h', title=f"All Countries ({num_countries} countries)")
-            fig.update_layout(height=400)
+            fig = _build_bar(tuple(country_counts.values), tuple(country_counts.index),
+                             f"All Countries ({num_countries} countries)", orientation='h')
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No country data available")
     
     def create_service_chart(self):
         """Create service distribution chart."""
-        service_col = self.get_best_column(['service'])
+        service_col = self.cols['service']
         if not service_col:
             st.info("No service information available")
             return
         
         st.markdown("**🎯 Service Distribution**")
         
-        service_counts = self.df[service_col].value_counts()
+        service_counts = self.count_values(service_col)
         if len(service_counts) > 0:
             # Create truncated labels for x-axis display
             truncated_labels = [name[:20] + '...' if len(name) > 20 else name for name in service_counts.index]
             
-            # Create the bar chart
-            fig = px.bar(x=truncated_labels, y=service_counts.values,
-                        title="Services Booked")
-            
-            # Update hover template to show full service name
-            fig.update_traces(
-                hovertemplate='<b>%{customdata}</b><br>Count: %{y}<extra></extra>',
-                customdata=service_counts.index
-            )
-            
-            fig.update_layout(height=400, xaxis_tickangle=-45)
+            # Create the bar chart, with the full service name on hover
+            fig = _build_bar(tuple(truncated_labels), tuple(service_counts.values),
+                             "Services Booked", hover_names=tuple(service_counts.index), tickangle=-45)
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No service data available")
     
     def create_role_chart(self):
         """Create role distribution chart."""
-        role_col = self.get_best_column(['role'])
+        role_col = self.cols['role']
         if not role_col:
             st.info("No role information available")
             return
@@ -812,19 +1148,14 @@ Full Traceback:
         st.markdown("**💃 Role Distribution**")
         
         # Get role counts including nulls for complete picture
-        role_counts = self.df[role_col].value_counts(dropna=False)
+        role_counts = self.count_values(role_col, dropna=False)
         
         # Replace NaN with 'Not Specified' for better display
-        role_counts.index = role_counts.index.fillna('Not Specified')
+        role_counts.index = role_counts.index.astype(object).fillna('Not Specified')
         
         if len(role_counts) > 0:
-            # Use colors that make sense for dance roles
-            colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4']
-            
-            fig = px.pie(values=role_counts.values, names=role_counts.index,
-                        title="Dance Role Distribution",
-                        color_discrete_sequence=colors)
-            fig.update_layout(height=400)
+            fig = _build_pie(tuple(role_counts.values), tuple(role_counts.index),
+                             "Dance Role Distribution", colors=_ROLE_COLORS)
             st.plotly_chart(fig, use_container_width=True)
             
             # Show summary stats
@@ -837,7 +1168,7 @@ Full Traceback:
     
     def create_revenue_charts(self):
         """Create revenue analysis charts."""
-        revenue_col = self.get_best_column(['payment', 'price'])
+        revenue_col = self.cols['revenue']
         if not revenue_col:
             return
         
@@ -851,26 +1182,25 @@ Full Traceback:
         
         with col1:
             # Revenue by country
-            country_col = self.get_best_column(['country'])
+            country_col = self.cols['country']
             if country_col:
-                revenue_by_country = self.df.groupby(country_col)[numeric_col].sum().sort_values(ascending=False).head(10)
+                revenue_by_country = _revenue_by_country(self.df[country_col], self.df[numeric_col], self._data_mtime)
                 if len(revenue_by_country) > 0:
-                    fig = px.bar(x=revenue_by_country.index, y=revenue_by_country.values,
-                               title="Revenue by Country (Top 10)")
-                    fig.update_layout(xaxis_tickangle=-45)
+                    fig = _build_bar(tuple(revenue_by_country.index), tuple(revenue_by_country.values),
+                                     "Revenue by Country (Top 10)", tickangle=-45)
                     st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             # Revenue over time
-            date_col = self.get_best_column(['created', 'date'])
+            date_col = self.cols['revenue_date']
             if date_col:
-                daily_revenue = self.df.groupby(self.df[date_col].dt.date)[numeric_col].sum().reset_index()
-                daily_revenue.columns = ['Date', 'Revenue']
+                daily_revenue = _daily_revenue(self.df[f"{date_col}_day"], self.df[numeric_col], self._data_mtime)
                 if len(daily_revenue) > 0:
-                    fig = px.line(daily_revenue, x='Date', y='Revenue',
-                                title="Daily Revenue", markers=True)
+                    fig = _build_line(tuple(daily_revenue.index), tuple(daily_revenue.values),
+                                      "Daily Revenue", 'Date', 'Revenue')
                     st.plotly_chart(fig, use_container_width=True)
     
+    @st.fragment
     def show_data_table(self):
         """Display the data table with export functionality."""
         if self.df is None or len(self.df) == 0:
@@ -878,17 +1208,34 @@ Full Traceback:
         
         st.subheader("📋 Appointments Data")
         
+        # Leave out the internal day-number columns
+        columns = [col for col in self.df.columns if not col.endswith('_day')]
+        
         # Display options
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            st.dataframe(self.df, use_container_width=True, height=400)
+            # Only send a bounded number of rows to the browser
+            rows = self.df
+            if len(self.df) > 100:
+                max_rows = min(len(self.df), 5000)
+                rows_to_show = st.slider(
+                    "📄 Rows to show",
+                    min_value=100,
+                    max_value=max_rows,
+                    value=min(500, max_rows),
+                    step=100,
+                    key="table_rows",
+                    help="The CSV download always contains every filtered appointment."
+                )
+                rows = self.df.head(rows_to_show)
+            st.dataframe(rows, column_order=columns, use_container_width=True, height=400)
         
         with col2:
             st.markdown("**Export Options**")
             
             # Download button
-            csv = self.df.to_csv(index=False)
+            csv = _to_csv(self.df, tuple(columns), self._data_mtime)
             st.download_button(
                 label="📥 Download CSV",
                 data=csv,
@@ -898,7 +1245,7 @@ Full Traceback:
             )
             
             # Show data info
-            st.info(f"📊 {len(self.df)} appointments\n📋 {len(self.df.columns)} columns")
+            st.info(f"📊 {len(self.df)} appointments\n📋 {len(columns)} columns")
     
     def run(self):
         """Run the main dashboard."""
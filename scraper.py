@@ -5,19 +5,72 @@ Logs into WordPress admin and exports appointment data as CSV.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import pandas as pd
+import numpy as np
+import io
 import os
+import re
 import sys
 from datetime import datetime
 from typing import Optional, Dict, Any
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from urllib3.util.retry import Retry
+
+
+# Token field names to look for, in order of preference
+TOKEN_NAMES = ['csrf_token', '_wpnonce', 'bookly_csrf_token', '_token', 'nonce']
+
+# <input name=... value=...> and <meta name=... content=...> tags in raw HTML
+# (attributes must follow whitespace, so data-name= / data-value= don't match)
+_INPUT_TOKEN_RE = re.compile(rb'<input\b[^>]*?\sname=["\']([^"\']*)["\'][^>]*?\svalue=["\']([^"\']*)["\']', re.I)
+_META_TOKEN_RE = re.compile(rb'<meta\b[^>]*?\sname=["\']([^"\']*)["\'][^>]*?\scontent=["\']([^"\']*)["\']', re.I)
+
+# Markers in the page WordPress returns after a login attempt
+_LOGIN_SUCCESS_RE = re.compile(rb'dashboard|wp-admin|welcome|howdy', re.I)
+_LOGIN_ERROR_RE = re.compile(rb'error|incorrect', re.I)
 
 
 class BooklyAppointmentsScraper:
     """Scraper for Bookly appointments from WordPress admin."""
     
+    # Exact fields as specified by the user
+    EXPORT_FIELDS = {
+        'action': 'bookly_pro_export_appointments',
+        'delimiter': ',',
+        'exp[id]': 'on',
+        'exp[start_date]': 'on',
+        'exp[staff_name]': 'on',
+        'exp[customer_full_name]': 'on',
+        'exp[customer_phone]': 'on',
+        'exp[customer_email]': 'on',
+        'exp[service_title]': 'on',
+        'exp[service_duration]': 'on',
+        'exp[status]': 'on',
+        'exp[payment]': 'on',
+        'exp[notes]': 'on',
+        'exp[created_date]': 'on',
+        'exp[customer_address]': 'on',
+        'exp[customer_birthday]': 'on',
+        'exp[online_meeting]': 'on',
+        'exp[custom_fields_23664]': 'on',
+        'exp[custom_fields_19734]': 'on',
+    }
+    
+    # Export filter; only the appointment date differs between the two requests
+    EXPORT_FILTER = {
+        "id": "",
+        "date": "any",
+        "created_date": "any",
+        "staff": None,
+        "customer": None,
+        "service": None,
+        "status": ["pending", "approved", "cancelled", "rejected", "done"]
+    }
+    
     def __init__(self, config: Dict[str, Any]):
         """Initialize the scraper with configuration."""
         self.config = config
@@ -25,6 +78,15 @@ class BooklyAppointmentsScraper:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
         })
+        # A small pool is enough for the two parallel exports. Transient gateway errors
+        # are retried; urllib3 leaves POSTs out of status retries by default.
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.csrf_token: Optional[str] = None
     
     def login(self) -> bool:
@@ -49,11 +111,10 @@ class BooklyAppointmentsScraper:
             resp.raise_for_status()
             
             # Check login success
-            success_indicators = ['dashboard', 'wp-admin', 'welcome', 'howdy']
-            if any(indicator in resp.text.lower() for indicator in success_indicators):
+            if _LOGIN_SUCCESS_RE.search(resp.content):
                 print("✅ Login successful!")
                 return True
-            elif any(error in resp.text.lower() for error in ['error', 'incorrect']):
+            elif _LOGIN_ERROR_RE.search(resp.content):
                 print("❌ Login failed - check credentials")
                 return False
             else:
@@ -78,12 +139,16 @@ class BooklyAppointmentsScraper:
                 print("❌ Redirected to login - authentication failed")
                 return None
             
-            soup = BeautifulSoup(resp.text, 'html.parser')
+            # Fast path: a single regex scan over the raw page
+            token = self.find_token_in_html(resp.content)
+            if token:
+                return token
             
-            # Look for various token names
-            token_names = ['csrf_token', '_wpnonce', 'bookly_csrf_token', '_token', 'nonce']
+            # Fall back to a full parse for markup the regexes don't cover
+            soup = BeautifulSoup(resp.content, 'lxml')
             
-            for token_name in token_names:
+            # Look for various token names
+            for token_name in TOKEN_NAMES:
                 # Check input fields
                 token_input = soup.find('input', {'name': token_name})
                 if token_input and token_input.get('value'):
@@ -113,39 +178,44 @@ class BooklyAppointmentsScraper:
             print(f"❌ Failed to get CSRF token: {e}")
             return None
     
+    def find_token_in_html(self, html: bytes) -> Optional[str]:
+        """Find a CSRF token in raw HTML, using the same preference order as the full parse.
+        
+        >>> scraper = BooklyAppointmentsScraper({})
+        >>> scraper.find_token_in_html(b'<input name="_wpnonce" data-value="bad" value="good">')
+        ✅ Found CSRF token: good...
+        'good'
+        >>> scraper.find_token_in_html(b'<input data-name="_wpnonce" name="other" value="zzz">') is None
+        True
+        """
+        # First occurrence of each name, like soup.find
+        inputs: Dict[str, str] = {}
+        for name, value in _INPUT_TOKEN_RE.findall(html):
+            inputs.setdefault(name.decode(errors='replace'), value.decode(errors='replace'))
+        metas: Dict[str, str] = {}
+        for name, content in _META_TOKEN_RE.findall(html):
+            metas.setdefault(name.decode(errors='replace'), content.decode(errors='replace'))
+        
+        for token_name in TOKEN_NAMES:
+            if inputs.get(token_name):
+                token = inputs[token_name]
+                print(f"✅ Found CSRF token: {token[:20]}...")
+                return token
+            if metas.get(token_name):
+                token = metas[token_name]
+                print(f"✅ Found CSRF token in meta: {token[:20]}...")
+                return token
+        
+        # Look for nonce in input names
+        for name, value in inputs.items():
+            if 'nonce' in name.lower() and value:
+                print(f"✅ Found nonce token: {value[:20]}...")
+                return value
+        return None
+    
     def get_export_fields(self, date_filter: str = "any") -> Dict[str, str]:
         """Get the export fields configuration."""
-        # Exact fields as specified by the user
-        return {
-            'action': 'bookly_pro_export_appointments',
-            'delimiter': ',',
-            'exp[id]': 'on',
-            'exp[start_date]': 'on',
-            'exp[staff_name]': 'on',
-            'exp[customer_full_name]': 'on',
-            'exp[customer_phone]': 'on',
-            'exp[customer_email]': 'on',
-            'exp[service_title]': 'on',
-            'exp[service_duration]': 'on',
-            'exp[status]': 'on',
-            'exp[payment]': 'on',
-            'exp[notes]': 'on',
-            'exp[created_date]': 'on',
-            'exp[customer_address]': 'on',
-            'exp[customer_birthday]': 'on',
-            'exp[online_meeting]': 'on',
-            'exp[custom_fields_23664]': 'on',
-            'exp[custom_fields_19734]': 'on',
-            'filter': json.dumps({
-                "id": "",
-                "date": date_filter,
-                "created_date": "any",
-                "staff": None,
-                "customer": None,
-                "service": None,
-                "status": ["pending", "approved", "cancelled", "rejected", "done"]
-            })
-        }
+        return {**self.EXPORT_FIELDS, 'filter': json.dumps({**self.EXPORT_FILTER, 'date': date_filter})}
     
     def export_appointments(self) -> Optional[bytes]:
         """Export appointments as CSV with two optimized requests."""
@@ -153,28 +223,29 @@ class BooklyAppointmentsScraper:
         
         export_url = f"{self.config['base_url']}/wp-admin/admin-ajax.php"
         
-        # First request with date filter "any"
-        print("🔄 Making first request (date: any)...")
+        # First request with date filter "any", second with date filter "null"
         payload_1 = self.get_export_fields("any")
+        payload_2 = self.get_export_fields("null")
         if self.csrf_token:
             payload_1['csrf_token'] = self.csrf_token
+            payload_2['csrf_token'] = self.csrf_token
+        
+        # The two exports don't depend on each other, so run them concurrently
+        print("🔄 Making both requests in parallel (date: any, date: null)...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_1 = executor.submit(self.session.post, export_url, data=payload_1, timeout=60)
+            future_2 = executor.submit(self.session.post, export_url, data=payload_2, timeout=60)
         
         try:
-            resp_1 = self.session.post(export_url, data=payload_1, timeout=60)
+            resp_1 = future_1.result()
             resp_1.raise_for_status()
             print(f"✅ First request successful ({len(resp_1.content)} bytes)")
         except requests.RequestException as e:
             print(f"❌ First export request failed: {e}")
             return None
         
-        # Second request with date filter "null"
-        print("🔄 Making second request (date: null)...")
-        payload_2 = self.get_export_fields("null")
-        if self.csrf_token:
-            payload_2['csrf_token'] = self.csrf_token
-        
         try:
-            resp_2 = self.session.post(export_url, data=payload_2, timeout=60)
+            resp_2 = future_2.result()
             resp_2.raise_for_status()
             print(f"✅ Second request successful ({len(resp_2.content)} bytes)")
         except requests.RequestException as e:
@@ -195,52 +266,60 @@ class BooklyAppointmentsScraper:
             print("⚠️  Returning first response as fallback")
             return resp_1.content
     
+    @staticmethod
+    def read_export(csv_data: bytes) -> pd.DataFrame:
+        """Parse an export response, using the multithreaded pyarrow parser when available.
+        
+        Every column is kept as the exported text, so the merged file is written back
+        exactly as Bookly produced it; only the ID is interpreted, when sorting.
+        """
+        columns = pd.read_csv(io.BytesIO(csv_data), nrows=0).columns
+        try:
+            import pyarrow as pa
+            from pyarrow import csv as pa_csv
+        except ImportError:
+            return pd.read_csv(io.BytesIO(csv_data), dtype=str, keep_default_na=False)
+        
+        # pandas' pyarrow engine always infers types, so read with pyarrow directly.
+        # Notes can hold quoted values spanning several lines.
+        parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+        convert_options = pa_csv.ConvertOptions(column_types={col: pa.string() for col in columns})
+        return pa_csv.read_csv(io.BytesIO(csv_data), parse_options=parse_options,
+                               convert_options=convert_options).to_pandas()
+    
     def merge_csv_responses(self, csv_1: bytes, csv_2: bytes) -> Optional[bytes]:
         """Merge two CSV responses, removing duplicates based on ID."""
         try:
-            # Save temporary files for debugging
-            with open('temp_export_1.csv', 'wb') as f:
-                f.write(csv_1)
-            with open('temp_export_2.csv', 'wb') as f:
-                f.write(csv_2)
-            
-            # Read both CSV files
-            df1 = pd.read_csv('temp_export_1.csv')
-            df2 = pd.read_csv('temp_export_2.csv')
+            # Read both CSV responses straight from memory
+            df1 = self.read_export(csv_1)
+            df2 = self.read_export(csv_2)
             
             print(f"📊 First CSV: {len(df1)} rows, {len(df1.columns)} columns")
             print(f"📊 Second CSV: {len(df2)} rows, {len(df2.columns)} columns")
             
             # Check if both have ID columns
             if 'ID' in df1.columns and 'ID' in df2.columns:
-                # Concatenate and remove duplicates based on ID
-                merged_df = pd.concat([df1, df2], ignore_index=True)
-                merged_df = merged_df.drop_duplicates(subset=['ID'], keep='first')
-                merged_df = merged_df.sort_values('ID')
+                # Only append rows from the second export whose ID isn't in the first one
+                new_rows = df2[~df2['ID'].isin(np.asarray(df1['ID']))]
+                merged_df = pd.concat([df1, new_rows], ignore_index=True)
+                if not merged_df['ID'].is_unique:
+                    # Duplicates within a single export
+                    merged_df = merged_df.drop_duplicates(subset=['ID'], keep='first')
+                merged_df = merged_df.sort_values(
+                    'ID', kind='stable', key=lambda ids: pd.to_numeric(ids, errors='coerce')
+                )
                 
                 print(f"📊 Merged CSV: {len(merged_df)} rows (duplicates removed)")
                 
                 # Convert back to CSV bytes
                 csv_string = merged_df.to_csv(index=False)
-                
-                # Clean up temporary files
-                os.remove('temp_export_1.csv')
-                os.remove('temp_export_2.csv')
-                
                 return csv_string.encode('utf-8')
             else:
                 print("⚠️  No ID column found, cannot merge properly")
-                # Clean up temporary files
-                os.remove('temp_export_1.csv')
-                os.remove('temp_export_2.csv')
                 return None
                 
         except Exception as e:
             print(f"❌ Error in merge_csv_responses: {e}")
-            # Clean up temporary files if they exist
-            for temp_file in ['temp_export_1.csv', 'temp_export_2.csv']:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
             return None
     
     def save_csv(self, csv_data: bytes, filename: str = 'Appointments.csv') -> bool: